@@ -1,19 +1,115 @@
 import os
-import shutil
 import aiohttp
+from contextlib import asynccontextmanager
 import tools
 import ow_config as config
-from zipfile import ZipFile, ZIP_LZMA
+from zipfile import ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA
 from fastapi import FastAPI, Request, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from starlette.datastructures import MutableHeaders
 
 
 MAIN_DIR = config.MAIN_DIR
 MANAGER_URL = config.MANAGER_URL
 
+# Алгоритм сжатия архивов. deflate в разы быстрее lzma и открывается любым клиентом
+ARCHIVE_COMPRESSIONS = {
+    'deflate': ZIP_DEFLATED,
+    'bzip2': ZIP_BZIP2,
+    'lzma': ZIP_LZMA,
+}
+try:
+    # zstd внутри zip поддерживается начиная с Python 3.14
+    from zipfile import ZIP_ZSTANDARD
+    ARCHIVE_COMPRESSIONS['zstd'] = ZIP_ZSTANDARD
+except ImportError:
+    pass
+
+
+def get_archive_compression(name: str) -> int:
+    """
+    Возвращает константу zipfile для алгоритма сжатия с именем name из config.
+
+    Raises:
+        ValueError: алгоритм не поддерживается (опечатка или zstd на Python до 3.14).
+    """
+    if name not in ARCHIVE_COMPRESSIONS:
+        raise ValueError(
+            f"ARCHIVE_COMPRESSION = {name!r} в config не поддерживается, "
+            f"допустимые значения: {', '.join(ARCHIVE_COMPRESSIONS)}"
+        )
+    return ARCHIVE_COMPRESSIONS[name]
+
+
+ARCHIVE_COMPRESSION_NAME = getattr(config, 'ARCHIVE_COMPRESSION', 'deflate')
+ARCHIVE_COMPRESSION = get_archive_compression(ARCHIVE_COMPRESSION_NAME)
+# Допустимые уровни сжатия для каждого алгоритма (для lzma zipfile уровень игнорирует)
+ARCHIVE_COMPRESSLEVELS = {
+    'deflate': range(0, 10),
+    'bzip2': range(1, 10),
+    'zstd': range(1, 23),
+}
+
+
+def check_archive_compresslevel(name: str, level) -> int:
+    """
+    Проверяет, что уровень сжатия level из config подходит для алгоритма name, и возвращает его.
+
+    Raises:
+        ValueError: уровень не целое число или вне допустимого для алгоритма диапазона.
+    """
+    allowed = ARCHIVE_COMPRESSLEVELS.get(name)
+    if allowed is None:
+        return level
+    # 6.0 in range(...) тоже True, но zlib и bz2 принимают только int
+    if isinstance(level, bool) or not isinstance(level, int) or level not in allowed:
+        raise ValueError(
+            f"ARCHIVE_COMPRESSLEVEL = {level!r} в config недопустим для {name}, "
+            f"допустимы целые числа от {allowed.start} до {allowed.stop - 1}"
+        )
+    return level
+
+
+ARCHIVE_COMPRESSLEVEL = check_archive_compresslevel(
+    ARCHIVE_COMPRESSION_NAME, getattr(config, 'ARCHIVE_COMPRESSLEVEL', 6)
+)
+# Уже сжатые форматы: их повторное сжатие тратит CPU и почти не уменьшает размер, поэтому кладем в архив как есть
+INCOMPRESSIBLE_EXTENSIONS = frozenset({
+    '.zip', '.7z', '.rar', '.gz', '.xz', '.bz2', '.zst',
+    '.png', '.jpg', '.jpeg', '.webp', '.gif',
+    '.mp3', '.ogg', '.mp4', '.webm',
+})
+
+# Максимум одновременных соединений с Manager
+MANAGER_CONNECTIONS_LIMIT = getattr(config, 'MANAGER_CONNECTIONS_LIMIT', 100)
+
+# Общая HTTP-сессия для запросов к Manager (соединения переиспользуются между запросами)
+http_session: aiohttp.ClientSession | None = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую HTTP-сессию, создавая ее при первом обращении.
+    """
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MANAGER_CONNECTIONS_LIMIT, keepalive_timeout=60)
+        )
+    return http_session
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Закрываем общую HTTP-сессию при остановке сервера
+    if http_session is not None:
+        await http_session.close()
+
 
 # Создание приложения
 app = FastAPI(
+    lifespan=lifespan,
     title="Open Workshop",
     contact={
         "name": "GitHub",
@@ -26,12 +122,31 @@ app = FastAPI(
     docs_url="/"
 )
 
-@app.middleware("http")
-async def modify_header(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Expose-Headers"] = "Content-Type,Content-Disposition"
-    return response
+
+class HeadersMiddleware:
+    """
+    Добавляет CORS заголовки ко всем ответам.
+
+    Работает на уровне ASGI: в отличие от @app.middleware("http") не пропускает тело ответа (файлы) через
+    промежуточный поток, а только дописывает заголовки в начало ответа.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["Access-Control-Allow-Origin"] = "*"
+                headers["Access-Control-Expose-Headers"] = "Content-Type,Content-Disposition"
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+app.add_middleware(HeadersMiddleware)
 
 
 @app.get(
@@ -67,20 +182,19 @@ async def download(request: Request, type: str, path: str):
     if os.path.exists(real_path):
         if type == 'archive' and path.startswith('mod/'):
             # Асинхронно спрашиваем у Manager правомерность доступа к файлу
-            async with aiohttp.ClientSession() as session:
-                id = int(path.split('/')[1])
-                user = request.cookies.get('userID', 0)
-                async with session.get(f"{MANAGER_URL}/list/mods/access/[{id}]?token={config.check_access}&user={user}") as resp:
-                    if resp.status == 200:
-                        # Возвращает такой же список, проверяем, есть ли в нем интересующий нас ID
-                        data = await resp.json()
-                        if id in data:
-                            # Если есть, то возвращаем сам файл
-                            return FileResponse(real_path)
-                        else:
-                            return PlainTextResponse(status_code=403, content="Access denied")
+            id = int(path.split('/')[1])
+            user = request.cookies.get('userID', 0)
+            async with get_http_session().get(f"{MANAGER_URL}/list/mods/access/[{id}]?token={config.check_access}&user={user}") as resp:
+                if resp.status == 200:
+                    # Возвращает такой же список, проверяем, есть ли в нем интересующий нас ID
+                    data = await resp.json()
+                    if id in data:
+                        # Если есть, то возвращаем сам файл
+                        return FileResponse(real_path)
                     else:
-                        return PlainTextResponse(status_code=503, content="Manager unavailable")
+                        return PlainTextResponse(status_code=403, content="Access denied")
+                else:
+                    return PlainTextResponse(status_code=503, content="Manager unavailable")
         else:
             return FileResponse(real_path)
     else:
@@ -107,7 +221,7 @@ async def upload(request: Request, token: str, file: UploadFile, type: str = For
 
     path: Путь и имя файла. В формате "директории/поддиректории/имя.файла". Если под папок нет существует, то они создаются.
     """
-    if not tools.check_token('upload_file', token):
+    if not await tools.check_token('upload_file', token):
         return PlainTextResponse(status_code=403, content="Access denied")
 
     real_path = f"{MAIN_DIR}/{type}/{path}"
@@ -119,12 +233,6 @@ async def upload(request: Request, token: str, file: UploadFile, type: str = For
         case "archive":
             # Если передан просто файл, то конвертируем его в архив
             if not path.endswith(".zip"):
-                # Создаем временный файл для архива
-                tmp_path = f"{MAIN_DIR}/{type}/{path}.tmp"
-                # Сохраняем файл в временный файл
-                with open(tmp_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-
                 # Валидируем путь (расширение в конце заменяем)
                 if '.' in real_path:
                     # Удалем все что после точки
@@ -134,11 +242,15 @@ async def upload(request: Request, token: str, file: UploadFile, type: str = For
                 if '.' not in path:
                     path += '.'+file.filename.split('.')[-1]
 
-                # Создаем архив
-                with ZipFile(real_path, "w", compression=ZIP_LZMA, compresslevel=9) as zipped:
-                    zipped.write(tmp_path, path.split('/')[-1])
-                # Удаляем временный файл
-                os.remove(tmp_path)
+                arcname = path.split('/')[-1]
+                if os.path.splitext(arcname)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+                    compression = ZIP_STORED
+                else:
+                    compression = ARCHIVE_COMPRESSION
+
+                # Создаем архив, сжимая загруженный файл напрямую.
+                # Сжатие занимает CPU надолго, поэтому выполняем его в пуле потоков, не блокируя остальные запросы
+                await run_in_threadpool(tools.copy_fileobj_to_zip, file.file, real_path, arcname, compression, ARCHIVE_COMPRESSLEVEL)
 
                 # Удаляем из начала "{MAIN_DIR}/{type}/"
                 real_path = real_path.replace(f"{MAIN_DIR}/{type}/", "")
@@ -146,13 +258,11 @@ async def upload(request: Request, token: str, file: UploadFile, type: str = For
             # Если передан архив, то просто сохраняем
             else:
                 # Сохраняем архив
-                with open(real_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
+                await run_in_threadpool(tools.copy_fileobj_to_path, file.file, real_path)
                 return path
         case _:
             # Сохраняем файл
-            with open(real_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            await run_in_threadpool(tools.copy_fileobj_to_path, file.file, real_path)
             return path
 
 @app.delete(
@@ -181,7 +291,7 @@ async def delete(request: Request, token: str, type: str = Form(), path: str = F
 
     Если после удаления файла, папка пуста, то она тоже удаляется (так же происходит со всеми родительскими папками)
     """
-    if not tools.check_token('delete_file', token):
+    if not await tools.check_token('delete_file', token):
         return PlainTextResponse(status_code=403, content="Access denied")
 
 
@@ -205,15 +315,15 @@ async def delete(request: Request, token: str, type: str = Form(), path: str = F
         folder_path = os.path.dirname(file_path)
         # Удаляем папку, если она пуста
         while folder_path != "":
-            if not os.listdir(folder_path):
-                # удаляем ее
+            # rmdir сам откажется удалять непустую папку, поэтому не читаем ее содержимое через listdir
+            try:
                 os.rmdir(folder_path)
-                # получаем путь к родительской папке
-                folder_path = os.path.dirname(folder_path)
             # Если в папке есть файлы,
-            else:
+            except OSError:
                 # то ничего не делаем
                 break
+            # получаем путь к родительской папке
+            folder_path = os.path.dirname(folder_path)
         
         return JSONResponse(status_code=200, content="File deleted")
 
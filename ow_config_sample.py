@@ -1,6 +1,13 @@
 
 MAIN_DIR = 'storage'
 MANAGER_URL = 'http://127.0.0.1:8000/api/manager'
+# Максимум одновременных соединений с Manager
+MANAGER_CONNECTIONS_LIMIT = 100
+
+# Сжатие загружаемых архивов: deflate, bzip2, lzma или zstd (Python 3.14+)
+ARCHIVE_COMPRESSION = 'deflate'
+# Уровень сжатия: deflate 0-9, bzip2 1-9, zstd 1-22 (для lzma не используется). Меньше - быстрее загрузка
+ARCHIVE_COMPRESSLEVEL = 6
 
 # Токены
 
@@ -8,5 +15,8 @@ MANAGER_URL = 'http://127.0.0.1:8000/api/manager'
 check_access = ''
 
 ## Принимаемые
+# Хеш bcrypt, "sha256$" + hashlib.sha256(токен).hexdigest() или "hmac-sha256$" + hmac.new(token_hmac_key, токен, sha256).hexdigest()
+# SHA-256 безопасен только для случайных токенов длиной от 32 символов, не для придуманных человеком паролей
+token_hmac_key = ''
 delete_file = ''
 upload_file = ''
@@ -0,0 +1,27 @@
+import hashlib
+import hmac
+import os
+import sys
+import types
+
+import bcrypt
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ow_config.py создается при развертывании и не хранится в репозитории, поэтому для тестов собираем его здесь
+config = types.ModuleType("ow_config")
+config.MAIN_DIR = "storage"
+config.MANAGER_URL = "http://127.0.0.1:8000/api/manager"
+config.check_access = ""
+config.token_hmac_key = "test-hmac-key"
+config.upload_file = bcrypt.hashpw(b"upload-token", bcrypt.gensalt(4)).decode()
+config.delete_file = ""
+config.sha256_file = "sha256$" + hashlib.sha256(b"sha256-token").hexdigest()
+config.sha256_upper_file = " SHA256$" + hashlib.sha256(b"sha256-token").hexdigest().upper() + "\n"
+config.hmac_file = "hmac-sha256$" + hmac.new(b"test-hmac-key", b"hmac-token", hashlib.sha256).hexdigest()
+# Значения, похожие на хеш, но с неверным форматом
+config.broken_bcrypt_file = "$2b$12$too-short"
+config.broken_sha256_file = "sha256$abc"
+config.broken_hmac_file = "hmac-sha256$" + "z" * 64
+sys.modules.setdefault("ow_config", config)
@@ -0,0 +1,50 @@
+import zipfile
+
+import pytest
+
+import main
+
+
+def test_get_archive_compression():
+    assert main.get_archive_compression('deflate') == zipfile.ZIP_DEFLATED
+    assert main.get_archive_compression('lzma') == zipfile.ZIP_LZMA
+
+
+@pytest.mark.parametrize("name", ["deflat", "", "DEFLATE"])
+def test_get_archive_compression_unknown(name):
+    with pytest.raises(ValueError, match="ARCHIVE_COMPRESSION"):
+        main.get_archive_compression(name)
+
+
+@pytest.mark.skipif(hasattr(zipfile, "ZIP_ZSTANDARD"), reason="zstd поддерживается начиная с Python 3.14")
+def test_get_archive_compression_zstd_unavailable():
+    with pytest.raises(ValueError, match="deflate, bzip2, lzma"):
+        main.get_archive_compression('zstd')
+
+
+@pytest.mark.parametrize(("name", "level"), [
+    ("deflate", 0),
+    ("deflate", 9),
+    ("bzip2", 1),
+    ("bzip2", 9),
+    ("zstd", 22),
+    # zipfile игнорирует уровень для lzma, поэтому он не проверяется
+    ("lzma", 15),
+])
+def test_check_archive_compresslevel(name, level):
+    assert main.check_archive_compresslevel(name, level) == level
+
+
+@pytest.mark.parametrize(("name", "level"), [
+    ("deflate", 10),
+    ("deflate", -1),
+    ("deflate", 15),
+    ("bzip2", 0),
+    ("zstd", 23),
+    ("deflate", 6.0),
+    ("deflate", "6"),
+    ("deflate", True),
+])
+def test_check_archive_compresslevel_invalid(name, level):
+    with pytest.raises(ValueError, match="ARCHIVE_COMPRESSLEVEL"):
+        main.check_archive_compresslevel(name, level)
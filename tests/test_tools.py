@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import stat
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+
+import pytest
+
+import tools
+
+
+def test_copy_fileobj_to_zip_entry_metadata(tmp_path):
+    zip_path = tmp_path / "mod.zip"
+    data = b"mod data" * 1000
+
+    tools.copy_fileobj_to_zip(BytesIO(data), str(zip_path), "mod.txt", zipfile.ZIP_DEFLATED, 6)
+
+    with zipfile.ZipFile(zip_path) as zipped:
+        info = zipped.getinfo("mod.txt")
+        assert zipped.read(info) == data
+
+    mode = info.external_attr >> 16
+    assert stat.S_ISREG(mode)
+    assert stat.S_IMODE(mode) == 0o644
+    assert info.compress_type == zipfile.ZIP_DEFLATED
+    # zip хранит время с точностью до 2 секунд
+    assert abs(time.mktime(info.date_time + (0, 0, -1)) - time.time()) < 10
+
+
+def _spooled(data: bytes, max_size: int) -> tempfile.SpooledTemporaryFile:
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    spool.write(data)
+    return spool
+
+
+def _track_kernel_copy(monkeypatch) -> list:
+    calls = []
+    kernel_copy = tools._kernel_copy
+
+    def tracked(src_fd, dst_fd, offset, count):
+        calls.append(count)
+        return kernel_copy(src_fd, dst_fd, offset, count)
+
+    monkeypatch.setattr(tools, "_kernel_copy", tracked)
+    return calls
+
+
+def test_copy_fileobj_to_path_in_memory_spool(tmp_path, monkeypatch):
+    calls = _track_kernel_copy(monkeypatch)
+    data = os.urandom(256 * 1024)
+    spool = _spooled(data, max_size=len(data) * 2)
+    spool.seek(0)
+
+    tools.copy_fileobj_to_path(spool, str(tmp_path / "file.bin"))
+
+    assert (tmp_path / "file.bin").read_bytes() == data
+    # Данные в памяти копируются обычным способом, без сброса на диск ради fileno()
+    assert calls == []
+
+
+def test_copy_fileobj_to_path_rolled_spool(tmp_path, monkeypatch):
+    calls = _track_kernel_copy(monkeypatch)
+    data = os.urandom(3 * tools.COPY_BUFSIZE + 123)
+    # Данные больше max_size, поэтому спул уже переехал в файл на диске
+    spool = _spooled(data, max_size=1024)
+    spool.seek(0)
+
+    tools.copy_fileobj_to_path(spool, str(tmp_path / "file.bin"))
+
+    assert (tmp_path / "file.bin").read_bytes() == data
+    assert calls == [len(data)]
+    assert spool.read() == b""
+
+
+def test_copy_fileobj_to_path_nonzero_offset(tmp_path):
+    data = os.urandom(2 * tools.COPY_BUFSIZE)
+    for spool in (_spooled(data, max_size=len(data) * 2), _spooled(data, max_size=1024)):
+        spool.seek(1000)
+
+        tools.copy_fileobj_to_path(spool, str(tmp_path / "file.bin"))
+
+        assert (tmp_path / "file.bin").read_bytes() == data[1000:]
+
+
+def test_copy_fileobj_to_path_partial_kernel_copy(tmp_path, monkeypatch):
+    data = os.urandom(2 * tools.COPY_BUFSIZE)
+    kernel_copy = tools._kernel_copy
+    # Ядро скопировало только часть, остаток должен дописаться обычным способом
+    monkeypatch.setattr(tools, "_kernel_copy", lambda src, dst, offset, count: kernel_copy(src, dst, offset, min(count, 1000)))
+    spool = _spooled(data, max_size=1024)
+    spool.seek(10)
+
+    tools.copy_fileobj_to_path(spool, str(tmp_path / "file.bin"))
+
+    assert (tmp_path / "file.bin").read_bytes() == data[10:]
+
+
+@pytest.mark.parametrize(("token_name", "token", "valid"), [
+    ("upload_file", "upload-token", True),
+    ("sha256_file", "sha256-token", True),
+    ("sha256_upper_file", "sha256-token", True),
+    ("hmac_file", "hmac-token", True),
+    # bcrypt не принимает токены длиннее 72 байт - это отказ, а не ошибка сервера
+    ("upload_file", "x" * 73, False),
+    ("upload_file", "upload-token" + "x" * 80, False),
+])
+def test_check_token(token_name, token, valid):
+    assert asyncio.run(tools.check_token(token_name, token)) is valid
+    # Повторная проверка идет через кеш
+    assert asyncio.run(tools.check_token(token_name, token)) is valid
+    assert not asyncio.run(tools.check_token(token_name, token + "x"))
+    assert not asyncio.run(tools.check_token(token_name, ""))
+
+
+def test_check_token_missing():
+    assert not asyncio.run(tools.check_token("delete_file", ""))
+    assert not asyncio.run(tools.check_token("no_such_token", "token"))
+
+
+def test_load_token_hashes_warns_about_malformed(caplog):
+    with caplog.at_level(logging.WARNING, logger=tools.logger.name):
+        hashes = tools._load_token_hashes()
+
+    broken = {"broken_bcrypt_file", "broken_sha256_file", "broken_hmac_file"}
+    assert not broken & hashes.keys()
+    assert {"upload_file", "sha256_file", "sha256_upper_file", "hmac_file"} <= hashes.keys()
+    warned = " ".join(record.getMessage() for record in caplog.records)
+    for name in broken:
+        assert f"`{name}`" in warned
+    # Обычные строковые настройки вроде MAIN_DIR хешами не считаются и не шумят в логе
+    assert "MAIN_DIR" not in warned
@@ -1,17 +1,216 @@
 import ow_config as config
+import os
+import logging
+import asyncio
+import hashlib
+import hmac
+import time
+import shutil
+import stat
+import secrets
+import tempfile
 import bcrypt
+from zipfile import ZipFile, ZipInfo
+
+
+logger = logging.getLogger(__name__)
+
+# Размер буфера при копировании файлов. Дефолтные 64 КБ shutil дают слишком много системных вызовов на больших файлах
+COPY_BUFSIZE = 1024 * 1024
+
+# Префиксы токенов, хранящихся в config как SHA-256 или HMAC-SHA256 (hex) вместо хеша bcrypt
+SHA256_TOKEN_PREFIX = b"sha256$"
+HMAC_TOKEN_PREFIX = b"hmac-sha256$"
+
+
+def _is_token_hash(value: bytes) -> bool:
+    # Хеш bcrypt всегда имеет длину 60 и начинается с $2a$, $2b$ или $2y$ - остальное bcrypt все равно отвергнет
+    if value.startswith((b"$2a$", b"$2b$", b"$2y$")):
+        return len(value) == 60
+    # SHA-256 и HMAC-SHA256 хранятся как 64 hex символа после префикса
+    for prefix in (SHA256_TOKEN_PREFIX, HMAC_TOKEN_PREFIX):
+        if value.startswith(prefix):
+            digest = value[len(prefix):]
+            return len(digest) == 64 and all(c in b"0123456789abcdef" for c in digest)
+    return False
+
+
+def _normalize_token_hash(value: str) -> bytes:
+    # Убираем случайные пробелы, а hex дайджесты SHA-256 приводим к нижнему регистру, как у hexdigest().
+    # Хеши bcrypt чувствительны к регистру и не меняются
+    value = value.strip().encode()
+    if value.lower().startswith((SHA256_TOKEN_PREFIX, HMAC_TOKEN_PREFIX)):
+        return value.lower()
+    return value
+
+
+def _load_token_hashes() -> dict[str, bytes]:
+    """
+    Собирает из config хеши принимаемых токенов, один раз переведенные в байты.
+
+    Значения, похожие на хеш, но с неверным форматом, пропускаются с предупреждением в лог:
+    иначе при запросе такой токен выглядел бы просто отсутствующим.
+    """
+    hashes = {}
+    for name, value in vars(config).items():
+        if not isinstance(value, str):
+            continue
+        value = _normalize_token_hash(value)
+        if _is_token_hash(value):
+            hashes[name] = value
+        elif value.startswith((b"$2", SHA256_TOKEN_PREFIX, HMAC_TOKEN_PREFIX)):
+            logger.warning("Токен `%s` в config похож на хеш, но имеет неверный формат - все запросы с ним будут отклонены!", name)
+    return hashes
+
+
+_TOKEN_HASHES: dict[str, bytes] = _load_token_hashes()
+_TOKEN_HMAC_KEY = getattr(config, 'token_hmac_key', '').encode()
+
+# Сколько секунд токен, прошедший проверку bcrypt, считается проверенным
+VERIFIED_TOKEN_TTL = 300
+
+# Ключ отпечатков токенов. Создается заново при каждом запуске, поэтому отпечатки из памяти процесса бесполезны вне его
+_FINGERPRINT_KEY = secrets.token_bytes(32)
+
+# Отпечатки токенов, уже прошедших проверку bcrypt, и время их устаревания. Ключ - хеш токена из config
+_verified_tokens: dict[bytes, tuple[bytes, float]] = {}
 
 
 async def check_token(token_name: str, token: str) -> bool:
     # Получаем значение хеша токена из config по имени token_name
-    stored_token_hash = getattr(config, token_name, None)
+    stored_token_hash = _TOKEN_HASHES.get(token_name)
     
     if stored_token_hash is None:
-        print(f"Токен `{token_name}` не найден в config!")
+        logger.warning("Токен `%s` не найден в config!", token_name)
         return False
     
-    # Хеш из config должен быть строкой, конвертируем в байты
-    stored_token_hash = stored_token_hash.encode()
-    
-    # Хешируем переданный токен с использованием bcrypt и проверяем соответствие
-    return bcrypt.checkpw(token.encode(), stored_token_hash)
+    token = token.encode()
+
+    # Токены сервисов - случайные строки с высокой энтропией, для них медленный bcrypt не нужен:
+    # подобрать такой токен по его SHA-256 не проще, чем перебрать сам токен
+    if stored_token_hash.startswith(SHA256_TOKEN_PREFIX):
+        token_sha256 = hashlib.sha256(token).hexdigest().encode()
+        return hmac.compare_digest(token_sha256, stored_token_hash[len(SHA256_TOKEN_PREFIX):])
+
+    if stored_token_hash.startswith(HMAC_TOKEN_PREFIX):
+        if not _TOKEN_HMAC_KEY:
+            logger.warning("Токен `%s` хранится как HMAC, но `token_hmac_key` не задан в config!", token_name)
+            return False
+        token_hmac = hmac.new(_TOKEN_HMAC_KEY, token, hashlib.sha256).hexdigest().encode()
+        return hmac.compare_digest(token_hmac, stored_token_hash[len(HMAC_TOKEN_PREFIX):])
+
+    # bcrypt учитывает только первые 72 байта, а новые версии на более длинный токен бросают ValueError
+    if len(token) > 72:
+        return False
+
+    # Если этот токен уже проходил проверку, то не гоняем bcrypt повторно
+    fingerprint = hashlib.blake2b(token, digest_size=16, key=_FINGERPRINT_KEY).digest()
+    verified = _verified_tokens.get(stored_token_hash)
+    if verified is not None and verified[1] > time.monotonic() and hmac.compare_digest(verified[0], fingerprint):
+        return True
+
+    # Хешируем переданный токен с использованием bcrypt и проверяем соответствие.
+    # bcrypt намеренно медленный и отпускает GIL, поэтому выполняем его в пуле потоков, не блокируя event loop
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, bcrypt.checkpw, token, stored_token_hash):
+        return False
+
+    # Запоминаем только успешные проверки: неверные токены всегда проходят через bcrypt
+    _verified_tokens[stored_token_hash] = (fingerprint, time.monotonic() + VERIFIED_TOKEN_TTL)
+    return True
+
+
+def _kernel_copy(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    """
+    Копирует count байт из src_fd (начиная с offset) в dst_fd силами ядра, не пропуская данные через Python.
+    На поддерживающих ФС copy_file_range может вообще не копировать данные (reflink).
+
+    Returns:
+        int: Сколько байт скопировано. Меньше count, если ядро или ФС такое копирование не поддерживают.
+    """
+    copied = 0
+    for copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+        if copy is None:
+            continue
+        try:
+            while copied < count:
+                if copy is os.sendfile:
+                    sent = os.sendfile(dst_fd, src_fd, offset + copied, count - copied)
+                else:
+                    sent = copy(src_fd, dst_fd, count - copied, offset + copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError:
+            pass
+        if copied:
+            break
+    return copied
+
+
+def copy_fileobj_to_path(fileobj, dest_path: str):
+    """
+    Сохраняет содержимое файлового объекта (например, загруженного файла) по пути dest_path.
+    """
+    # UploadFile хранит загрузку в SpooledTemporaryFile. Пока файл маленький, данные лежат в памяти,
+    # и fileno() сбросил бы их на диск - такие файлы копируем обычным способом.
+    # Публичного способа узнать, где лежат данные, у SpooledTemporaryFile нет, поэтому сознательно опираемся
+    # на внутренний атрибут CPython _rolled. Если он пропадет, спул просто будет копироваться обычным способом
+    if isinstance(fileobj, tempfile.SpooledTemporaryFile):
+        on_disk = getattr(fileobj, "_rolled", False)
+    else:
+        on_disk = True
+
+    src_fd = None
+    if on_disk:
+        try:
+            src_fd = fileobj.fileno()
+        except (AttributeError, OSError):
+            pass
+
+    with open(dest_path, "wb") as buffer:
+        if src_fd is not None:
+            # Источник - настоящий файл, копируем средствами ядра.
+            # Сначала сбрасываем буфер записи, чтобы размер файла на диске совпадал с содержимым объекта
+            fileobj.flush()
+            offset = fileobj.tell()
+            count = os.fstat(src_fd).st_size - offset
+            copied = _kernel_copy(src_fd, buffer.fileno(), offset, count)
+            fileobj.seek(offset + copied)
+            if copied == count:
+                return
+            # Дописываем остаток обычным способом
+            buffer.seek(copied)
+
+        readinto = getattr(fileobj, "readinto", None)
+        if readinto is None:
+            shutil.copyfileobj(fileobj, buffer, COPY_BUFSIZE)
+            return
+
+        # Читаем всегда в один и тот же буфер, не создавая новый bytes на каждый кусок
+        chunk = bytearray(COPY_BUFSIZE)
+        view = memoryview(chunk)
+        while size := readinto(chunk):
+            buffer.write(view[:size])
+
+
+def copy_fileobj_to_zip(fileobj, zip_path: str, arcname: str, compression: int, compresslevel: int | None = None):
+    """
+    Упаковывает содержимое файлового объекта в новый zip архив zip_path под именем arcname.
+
+    Данные сжимаются прямо из fileobj, без сохранения во временный файл и повторного чтения с диска.
+    """
+    # Описываем запись сами: по голому имени zipfile ставит дату 1980 года и права 0600
+    info = ZipInfo(arcname, time.localtime()[:6])
+    info.external_attr = (stat.S_IFREG | 0o644) << 16
+    info.compress_type = compression
+    # До Python 3.13 уровень сжатия записи хранится в приватном _compresslevel
+    if hasattr(info, "compress_level"):
+        info.compress_level = compresslevel
+    else:
+        info._compresslevel = compresslevel
+
+    with ZipFile(zip_path, "w", compression=compression, compresslevel=compresslevel) as zipped:
+        # Размер заранее неизвестен, поэтому сразу разрешаем zip64 (иначе файлы больше 2 ГБ вызовут ошибку)
+        with zipped.open(info, "w", force_zip64=True) as entry:
+            shutil.copyfileobj(fileobj, entry, COPY_BUFSIZE)